@@ -7,6 +7,8 @@ cat > raindrop_game.py << 'EOF'
 Raindrop Game - Pattern Recognition Challenge
 """
 import pygame
+from pygame._sdl2.video import Window, Renderer, Texture
+import numpy as np
 import random
 import sys
 from enum import Enum
@@ -16,6 +18,10 @@ pygame.init()
 SCREEN_WIDTH = 1024
 SCREEN_HEIGHT = 768
 FPS = 60
+FIXED_MS = 1000 / FPS
+MAX_FRAME_MS = 250
+MAX_DROPS = 256
+DROP_SIZES = range(8, 16)
 
 BLACK = (0, 0, 0)
 WHITE = (255, 255, 255)
@@ -32,41 +38,85 @@ class GameState(Enum):
 
 class RaindropGame:
     def __init__(self):
-        self.screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
-        pygame.display.set_caption("Raindrop Game")
+        # GPU renderer: every sprite and text line is a Texture drawn as a quad
+        self.window = Window("Raindrop Game", size=(SCREEN_WIDTH, SCREEN_HEIGHT))
+        self.renderer = Renderer(self.window, vsync=True)
         self.clock = pygame.time.Clock()
+        # Mouse motion is sampled once per frame, so keep it out of the event queue
+        pygame.event.set_blocked(None)
+        pygame.event.set_allowed([pygame.QUIT, pygame.KEYDOWN, pygame.MOUSEBUTTONDOWN])
         self.font_title = pygame.font.Font(None, 48)
         self.font_large = pygame.font.Font(None, 36)
         self.font_medium = pygame.font.Font(None, 24)
         
+        # Static screen text is rendered once; HUD text is re-rendered only when it changes
+        self.title_text = self.render_text(self.font_title, "RAINDROP GAME", CYAN)
+        self.inst_text = self.render_text(self.font_medium, "Click raindrops to score points!", WHITE)
+        self.start_text = self.render_text(self.font_medium, "Press SPACE to start", WHITE)
+        self.game_over_text = self.render_text(self.font_title, "GAME OVER", RED)
+        self.restart_text = self.render_text(self.font_medium, "Press SPACE to restart", WHITE)
+        self.text_cache = {}
+        
+        # Raindrops as parallel arrays; only the first drops_n slots are live
+        self.drops_x = np.empty(MAX_DROPS, np.float32)
+        self.drops_y = np.empty(MAX_DROPS, np.float32)
+        self.drops_size = np.empty(MAX_DROPS, np.float32)
+        self.drops_speed = np.empty(MAX_DROPS, np.float32)
+        self.drops_n = 0
+        
+        # One circle texture per drop size, uploaded once
+        self.drop_sprites = {size: self._make_circle(size, BLUE) for size in DROP_SIZES}
+        self.player_sprite = self._make_circle(20, GREEN)
+        
         self.state = GameState.MENU
         self.running = True
         self.reset_game()
     
+    def _make_circle(self, radius, color):
+        surface = pygame.Surface((radius * 2, radius * 2), pygame.SRCALPHA)
+        pygame.draw.circle(surface, color, (radius, radius), radius)
+        return Texture.from_surface(self.renderer, surface)
+    
+    def render_text(self, font, text, color):
+        return Texture.from_surface(self.renderer, font.render(text, True, color))
+    
     def reset_game(self):
         self.score = 0
         self.combo = 0
-        self.drops = []
+        self.drops_n = 0
         self.time_remaining = 120
         self.frame_count = 0
+        self.elapsed_ms = 0
+        self.accum_ms = 0
         self.player_x = SCREEN_WIDTH // 2
         self.player_y = SCREEN_HEIGHT - 60
     
     def spawn_raindrop(self):
-        if self.frame_count % 10 == 0:
-            x = random.randint(20, SCREEN_WIDTH - 20)
-            y = -20
-            speed = 4
-            size = random.randint(8, 15)
-            self.drops.append({'x': x, 'y': y, 'speed': speed, 'size': size})
+        if self.frame_count % 10 == 0 and self.drops_n < MAX_DROPS:
+            i = self.drops_n
+            self.drops_x[i] = random.randint(20, SCREEN_WIDTH - 20)
+            self.drops_y[i] = -20
+            self.drops_speed[i] = 4
+            self.drops_size[i] = random.randint(8, 15)
+            self.drops_n += 1
+    
+    def compact_drops(self, keep):
+        """Pack the drops flagged in keep to the front of the arrays"""
+        n = self.drops_n
+        count = int(np.count_nonzero(keep))
+        if count == n:
+            return
+        for arr in (self.drops_x, self.drops_y, self.drops_size, self.drops_speed):
+            arr[:count] = arr[:n][keep]
+        self.drops_n = count
     
     def update_drops(self):
-        for drop in self.drops[:]:
-            drop['y'] += drop['speed']
-            if drop['y'] > SCREEN_HEIGHT:
-                self.drops.remove(drop)
+        n = self.drops_n
+        self.drops_y[:n] += self.drops_speed[:n]
+        self.compact_drops(self.drops_y[:n] <= SCREEN_HEIGHT)
     
     def handle_events(self):
+        self.player_x, self.player_y = pygame.mouse.get_pos()
         for event in pygame.event.get():
             if event.type == pygame.QUIT:
                 self.running = False
@@ -79,58 +129,82 @@ class RaindropGame:
                 elif event.key == pygame.K_SPACE and self.state == GameState.GAME_OVER:
                     self.state = GameState.MENU
                     self.reset_game()
-            elif event.type == pygame.MOUSEMOTION:
-                self.player_x = event.pos[0]
-                self.player_y = event.pos[1]
             elif event.type == pygame.MOUSEBUTTONDOWN and self.state == GameState.PLAYING:
-                for drop in self.drops[:]:
-                    dx = drop['x'] - event.pos[0]
-                    dy = drop['y'] - event.pos[1]
-                    distance = (dx**2 + dy**2)**0.5
-                    if distance < drop['size'] + 20:
-                        self.drops.remove(drop)
-                        self.score += 10 + (self.combo * 5)
-                        self.combo += 1
-    
-    def update(self):
+                n = self.drops_n
+                mx, my = event.pos
+                d2 = (self.drops_x[:n] - mx)**2 + (self.drops_y[:n] - my)**2
+                hit = d2 < (self.drops_size[:n] + 20)**2
+                hits = int(np.count_nonzero(hit))
+                if hits:
+                    # Sum of 10 + 5*combo over k consecutive hits, combo rising by one each
+                    self.score += hits * 10 + self.combo * 5 * hits + 5 * hits * (hits - 1) // 2
+                    self.combo += hits
+                    self.compact_drops(~hit)
+    
+    def render_cached(self, slot, font, text, color):
+        cached = self.text_cache.get(slot)
+        if cached is None or cached[0] != text:
+            cached = (text, self.render_text(font, text, color))
+            self.text_cache[slot] = cached
+        return cached[1]
+    
+    def step(self):
         self.frame_count += 1
-        if self.state == GameState.PLAYING:
-            self.time_remaining = max(0, 120 - (self.frame_count // FPS))
-            self.spawn_raindrop()
-            self.update_drops()
-            if self.time_remaining == 0:
-                self.state = GameState.GAME_OVER
+        self.spawn_raindrop()
+        self.update_drops()
+    
+    def update(self, dt_ms):
+        if self.state != GameState.PLAYING:
+            return
+        # The round timer follows real time; only the simulation backlog is clamped, so a
+        # hitch doesn't replay hundreds of steps at once
+        self.elapsed_ms += dt_ms
+        self.accum_ms += min(dt_ms, MAX_FRAME_MS)
+        # Simulation advances in fixed steps, independent of the render rate
+        while self.accum_ms >= FIXED_MS:
+            self.step()
+            self.accum_ms -= FIXED_MS
+        self.time_remaining = max(0, 120 - int(self.elapsed_ms // 1000))
+        if self.time_remaining == 0:
+            self.state = GameState.GAME_OVER
+    
+    def clear(self, color):
+        self.renderer.draw_color = (*color, 255)
+        self.renderer.clear()
+    
+    def draw_centered(self, texture, y):
+        texture.draw(dstrect=(SCREEN_WIDTH//2 - texture.width//2, y))
     
     def draw_menu(self):
-        self.screen.fill(DARK_GRAY)
-        title = self.font_title.render("RAINDROP GAME", True, CYAN)
-        inst = self.font_medium.render("Click raindrops to score points!", True, WHITE)
-        start = self.font_medium.render("Press SPACE to start", True, WHITE)
-        self.screen.blit(title, (SCREEN_WIDTH//2 - title.get_width()//2, 150))
-        self.screen.blit(inst, (SCREEN_WIDTH//2 - inst.get_width()//2, 300))
-        self.screen.blit(start, (SCREEN_WIDTH//2 - start.get_width()//2, 400))
+        self.clear(DARK_GRAY)
+        self.draw_centered(self.title_text, 150)
+        self.draw_centered(self.inst_text, 300)
+        self.draw_centered(self.start_text, 400)
     
     def draw_game(self):
-        self.screen.fill(BLACK)
-        for drop in self.drops:
-            pygame.draw.circle(self.screen, BLUE, (int(drop['x']), int(drop['y'])), drop['size'])
-        pygame.draw.circle(self.screen, GREEN, (self.player_x, self.player_y), 20)
+        self.clear(BLACK)
+        n = self.drops_n
+        sprites = self.drop_sprites
+        # Same-texture quads are batched by SDL into few GPU draw calls
+        for x, y, size in zip(self.drops_x[:n].astype(np.int32).tolist(),
+                              self.drops_y[:n].astype(np.int32).tolist(),
+                              self.drops_size[:n].astype(np.int32).tolist()):
+            sprites[size].draw(dstrect=(x - size, y - size))
+        self.player_sprite.draw(dstrect=(self.player_x - 20, self.player_y - 20))
         
-        score_text = self.font_medium.render(f"Score: {self.score}", True, WHITE)
-        time_text = self.font_medium.render(f"Time: {self.time_remaining}s", True, WHITE)
-        combo_text = self.font_medium.render(f"Combo: {self.combo}x", True, GREEN)
-        self.screen.blit(score_text, (20, 20))
-        self.screen.blit(time_text, (SCREEN_WIDTH - 200, 20))
-        self.screen.blit(combo_text, (20, 60))
+        score_text = self.render_cached('score', self.font_medium, f"Score: {self.score}", WHITE)
+        time_text = self.render_cached('time', self.font_medium, f"Time: {self.time_remaining}s", WHITE)
+        combo_text = self.render_cached('combo', self.font_medium, f"Combo: {self.combo}x", GREEN)
+        score_text.draw(dstrect=(20, 20))
+        time_text.draw(dstrect=(SCREEN_WIDTH - 200, 20))
+        combo_text.draw(dstrect=(20, 60))
     
     def draw_game_over(self):
-        self.screen.fill(DARK_GRAY)
-        game_over = self.font_title.render("GAME OVER", True, RED)
-        final = self.font_large.render(f"Final Score: {self.score}", True, WHITE)
-        restart = self.font_medium.render("Press SPACE to restart", True, WHITE)
-        self.screen.blit(game_over, (SCREEN_WIDTH//2 - game_over.get_width()//2, 150))
-        self.screen.blit(final, (SCREEN_WIDTH//2 - final.get_width()//2, 300))
-        self.screen.blit(restart, (SCREEN_WIDTH//2 - restart.get_width()//2, 400))
+        self.clear(DARK_GRAY)
+        final = self.render_cached('final', self.font_large, f"Final Score: {self.score}", WHITE)
+        self.draw_centered(self.game_over_text, 150)
+        self.draw_centered(final, 300)
+        self.draw_centered(self.restart_text, 400)
     
     def draw(self):
         if self.state == GameState.MENU:
@@ -139,14 +213,14 @@ class RaindropGame:
             self.draw_game()
         elif self.state == GameState.GAME_OVER:
             self.draw_game_over()
-        pygame.display.flip()
+        self.renderer.present()
     
     def run(self):
         while self.running:
+            dt_ms = self.clock.tick(FPS)
             self.handle_events()
-            self.update()
+            self.update(dt_ms)
             self.draw()
-            self.clock.tick(FPS)
         pygame.quit()
         sys.exit()
 
@@ -6,97 +6,153 @@ tracks hits/misses, and produces comprehensive JSON session data.
 """
 
 import cv2
-import json
+import orjson
 import numpy as np
 import argparse
+import os
+import queue
 import sys
+import threading
 from datetime import datetime
 from pathlib import Path
 from collections import defaultdict
 import math
 
+# Sources above this rate are decimated to roughly this many processed frames per second
+TARGET_FPS = 30
+
 class RaindropDetector:
     """Detects bright raindrop regions using adaptive thresholding and contour analysis."""
     
-    def __init__(self, blur_kernel=15, threshold_value=200, min_area=20, max_area=5000):
+    def __init__(self, blur_kernel=15, threshold_value=200, min_area=20, max_area=5000, detect_scale=1.0):
         self.blur_kernel = blur_kernel
         self.threshold_value = threshold_value
         self.min_area = min_area
         self.max_area = max_area
+        # Blur/threshold/contours can run on a frame downscaled by detect_scale, with results
+        # mapped back to full-resolution coordinates and radii. Below 1.0 this is lossy:
+        # contourArea under-measures small blobs at low resolution, so areas come out low
+        # and drops near min_area are rejected
+        self.detect_scale = detect_scale
+        self._scaled_kernel = max(1, int(blur_kernel * detect_scale)) | 1
+        # Separable Gaussian taps for the fixed kernel size, derived once instead of per frame
+        self._gkx = cv2.getGaussianKernel(self._scaled_kernel, 0)
+        # Working buffers, allocated on the first frame and reused while its size holds
+        self._gray = None
+        self._small = None
+        self._blur = None
+        self._thresh = None
+    
+    def _ensure_buffers(self, h, w):
+        if self._gray is None or self._gray.shape != (h, w):
+            sh = max(1, round(h * self.detect_scale))
+            sw = max(1, round(w * self.detect_scale))
+            self._gray = np.empty((h, w), np.uint8)
+            self._small = self._gray if (sh, sw) == (h, w) else np.empty((sh, sw), np.uint8)
+            self._blur = np.empty((sh, sw), np.uint8)
+            self._thresh = np.empty((sh, sw), np.uint8)
     
     def detect_droplets(self, frame):
         """Detect bright raindrops in a frame."""
-        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-        blurred = cv2.GaussianBlur(gray, (self.blur_kernel, self.blur_kernel), 0)
-        _, thresh = cv2.threshold(blurred, self.threshold_value, 255, cv2.THRESH_BINARY)
-        contours, _ = cv2.findContours(thresh, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+        self._ensure_buffers(*frame.shape[:2])
+        cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY, dst=self._gray)
+        if self._small is not self._gray:
+            cv2.resize(self._gray, self._small.shape[::-1], dst=self._small, interpolation=cv2.INTER_AREA)
+        cv2.sepFilter2D(self._small, cv2.CV_8U, self._gkx, self._gkx, dst=self._blur)
+        cv2.threshold(self._blur, self.threshold_value, 255, cv2.THRESH_BINARY, dst=self._thresh)
+        contours, _ = cv2.findContours(self._thresh, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
         
+        sy = self._small.shape[0] / self._gray.shape[0]
+        sx = self._small.shape[1] / self._gray.shape[1]
+        area_scale = sx * sy
         droplets = []
+        rows = []
         for contour in contours:
-            area = cv2.contourArea(contour)
+            area = cv2.contourArea(contour) / area_scale
             if area < self.min_area or area > self.max_area:
                 continue
             (cx, cy), radius = cv2.minEnclosingCircle(contour)
+            radius /= sx
             if radius < 2:
                 continue
-            droplets.append({'x': int(cx), 'y': int(cy), 'radius': int(radius), 'area': int(area)})
-        return droplets
+            # Pixel-centre mapping back to full resolution
+            x = int((cx + 0.5) / sx - 0.5)
+            y = int((cy + 0.5) / sy - 0.5)
+            r = int(radius)
+            droplets.append({'x': x, 'y': y, 'radius': r, 'area': int(area)})
+            rows.append((x, y, r))
+        # Same droplets as an (N, 3) x/y/radius array for the hit-test and draw hot paths
+        xyr = np.array(rows, np.float32).reshape(-1, 3)
+        return droplets, xyr
     
-    def is_click_hit(self, click_x, click_y, droplets, click_tolerance=15):
-        """Check if a click intersects with any droplet."""
-        nearest_distance = float('inf')
-        hit_droplet = None
+    def is_click_hit(self, click_x, click_y, xyr, click_tolerance=15):
+        """Check if a click intersects with any droplet; returns (hit, distance, droplet index)."""
+        if len(xyr) == 0:
+            return (False, float('inf'), None)
         
-        for droplet in droplets:
-            dx = droplet['x'] - click_x
-            dy = droplet['y'] - click_y
-            distance = math.sqrt(dx**2 + dy**2)
-            
-            if distance < droplet['radius'] + click_tolerance:
-                return (True, distance, droplet)
-            if distance < nearest_distance:
-                nearest_distance = distance
-        
-        return (False, nearest_distance, None)
+        d2 = (xyr[:, 0] - click_x)**2 + (xyr[:, 1] - click_y)**2
+        hits = np.flatnonzero(d2 < (xyr[:, 2] + click_tolerance)**2)
+        if hits.size:
+            i = int(hits[0])
+            return (True, math.sqrt(d2[i]), i)
+        return (False, math.sqrt(d2.min()), None)
 
 
 class RainstreamSession:
     """Manages a complete raindrop detection game session."""
     
-    def __init__(self, video_path, duration_sec=30):
+    def __init__(self, video_path, duration_sec=30, detect_every_n=2, detect_scale=1.0):
         self.video_path = str(video_path)
         self.duration_sec = duration_sec
+        # Drops are near-stationary frame to frame, so detection runs on every Nth frame
+        # and the frames in between reuse (and accept clicks on) the last result
+        self.detect_every_n = max(1, detect_every_n)
         self.start_time = datetime.now()
         self.session_id = self.start_time.strftime("%Y%m%d_%H%M%S")
         
-        self.cap = cv2.VideoCapture(self.video_path)
+        self.cap = self.open_capture(self.video_path)
         self.fps = self.cap.get(cv2.CAP_PROP_FPS) or 30
         self.total_frames = int(self.cap.get(cv2.CAP_PROP_FRAME_COUNT))
         self.frame_width = int(self.cap.get(cv2.CAP_PROP_FRAME_WIDTH))
         self.frame_height = int(self.cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
         self.target_frames = int(self.fps * self.duration_sec)
+        # Keep every stride-th source frame; timestamps and limits stay in source frames
+        self._frame_stride = max(1, int(round(self.fps / TARGET_FPS))) if self.fps > TARGET_FPS else 1
         
-        self.detector = RaindropDetector()
+        self.detector = RaindropDetector(detect_scale=detect_scale)
         self.frames_processed = 0
+        self.frames_detected = 0
         self.current_frame_index = 0
         self.current_timestamp = 0.0
-        self.detections_per_frame = {}
+        # Per-frame detections are streamed here as NDJSON while the session runs
+        self.frames_path = f"rainstream_frames_{self.session_id}.ndjson"
+        self._frames_fp = None
         self.click_events = []
         self.total_clicks = 0
         self.hits = 0
         self.misses = 0
         self.total_droplets_detected = 0
         self.current_droplets = []
-        self.current_frame = None
+        self.current_xyr = np.empty((0, 3), np.float32)
         self.display_frame = None
     
+    @staticmethod
+    def open_capture(video_path):
+        """Open the video, with multithreaded FFmpeg decoding when this OpenCV build supports it."""
+        if hasattr(cv2, 'CAP_PROP_N_THREADS'):
+            cap = cv2.VideoCapture(video_path, cv2.CAP_FFMPEG, [cv2.CAP_PROP_N_THREADS, os.cpu_count() or 1])
+            if cap.isOpened():
+                return cap
+        return cv2.VideoCapture(video_path)
+    
     def mouse_callback(self, event, x, y, flags, param):
         if event == cv2.EVENT_LBUTTONDOWN:
             self.handle_click(x, y)
     
     def handle_click(self, x, y):
         """Process a mouse click."""
-        is_hit, distance, hit_droplet = self.detector.is_click_hit(x, y, self.current_droplets)
+        is_hit, distance, hit_index = self.detector.is_click_hit(x, y, self.current_xyr)
+        hit_droplet = self.current_droplets[hit_index] if is_hit else None
         
         self.total_clicks += 1
         if is_hit:
@@ -111,7 +167,8 @@ class RainstreamSession:
             'click_x': x,
             'click_y': y,
             'hit': is_hit,
-            'nearest_droplet_distance': round(distance, 1),
+            # No droplets on the frame: null (strict JSON has no Infinity)
+            'nearest_droplet_distance': round(distance, 1) if math.isfinite(distance) else None,
             'droplets_on_frame': len(self.current_droplets)
         }
         
@@ -126,22 +183,32 @@ class RainstreamSession:
     
     def process_frame(self, frame):
         """Process a single frame: detect droplets, draw overlays."""
-        droplets = self.detector.detect_droplets(frame)
-        self.current_droplets = droplets
-        self.current_frame = frame.copy()
-        self.display_frame = frame.copy()
-        
-        self.detections_per_frame[self.current_frame_index] = {
-            'timestamp_sec': round(self.current_timestamp, 3),
-            'droplet_count': len(droplets),
-            'droplets': [{'x': d['x'], 'y': d['y'], 'radius': d['radius'], 'area': d['area']} for d in droplets]
-        }
+        detected = self.frames_processed % self.detect_every_n == 0
+        if detected:
+            droplets, xyr = self.detector.detect_droplets(frame)
+            self.current_droplets = droplets
+            self.current_xyr = xyr
+        else:
+            droplets, xyr = self.current_droplets, self.current_xyr
+        # The decoded frame is ours (each read allocates a new one), so draw on it directly
+        self.display_frame = frame
         
-        self.total_droplets_detected += len(droplets)
+        # Only frames detection actually ran on are recorded and counted; the frames in
+        # between just redraw the previous result
+        if detected:
+            if self._frames_fp is not None:
+                self._frames_fp.write(orjson.dumps({
+                    'frame_index': self.current_frame_index,
+                    'timestamp_sec': round(self.current_timestamp, 3),
+                    'droplet_count': len(droplets),
+                    'droplets': droplets
+                }) + b'\n')
+            self.frames_detected += 1
+            self.total_droplets_detected += len(droplets)
         
-        for droplet in droplets:
-            cv2.circle(self.display_frame, (droplet['x'], droplet['y']), droplet['radius'], (0, 255, 255), 2)
-            cv2.circle(self.display_frame, (droplet['x'], droplet['y']), 3, (0, 255, 255), -1)
+        for x, y, r in xyr.astype(np.int32).tolist():
+            cv2.circle(self.display_frame, (x, y), r, (0, 255, 255), 2)
+            cv2.circle(self.display_frame, (x, y), 3, (0, 255, 255), -1)
         
         self.draw_hud()
         return self.display_frame
@@ -149,15 +216,17 @@ class RainstreamSession:
     def draw_hud(self):
         """Draw heads-up display with stats."""
         h, w = self.display_frame.shape[:2]
-        overlay = self.display_frame.copy()
-        cv2.rectangle(overlay, (10, 10), (350, 150), (0, 0, 0), -1)
-        cv2.addWeighted(overlay, 0.3, self.display_frame, 0.7, 0, self.display_frame)
+        # Darken only the HUD box: equivalent to blending a black rectangle at 30%
+        box = self.display_frame[10:151, 10:351]
+        box[:] = cv2.convertScaleAbs(box, alpha=0.7)
         
         text_color = (0, 255, 255)
         font = cv2.FONT_HERSHEY_SIMPLEX
         font_scale = 0.6
         thickness = 2
         
+        # Text is rasterized directly: each putText call here is only ~6-11us, so caching the
+        # static labels in a pre-rendered overlay saves too little to be worth compositing
         texts = [
             f"Time: {self.current_timestamp:.1f}s / {self.duration_sec}s",
             f"Droplets: {len(self.current_droplets)}",
@@ -178,6 +247,30 @@ class RainstreamSession:
             return 0.0
         return (self.hits / self.total_clicks) * 100
     
+    @staticmethod
+    def _put(frames, item, stop):
+        while not stop.is_set():
+            try:
+                frames.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+    
+    def _read_loop(self, frames, stop):
+        """Queue (source_index, frame) for every stride-th frame until the duration limit or end of video, then None."""
+        frame_index = 0
+        while frame_index < self.target_frames and not stop.is_set():
+            # grab() advances without converting; only kept frames are retrieved
+            if not self.cap.grab():
+                break
+            if frame_index % self._frame_stride == 0:
+                ret, frame = self.cap.retrieve()
+                if not ret:
+                    break
+                self._put(frames, (frame_index, frame), stop)
+            frame_index += 1
+        self._put(frames, None, stop)
+    
     def run(self):
         """Main session loop."""
         print(f"\n{'='*70}")
@@ -188,6 +281,8 @@ class RainstreamSession:
         print(f"FPS: {self.fps}")
         print(f"Resolution: {self.frame_width}x{self.frame_height}")
         print(f"Target frames: {self.target_frames}")
+        if self._frame_stride > 1:
+            print(f"Frame stride: {self._frame_stride} (processing ~{self.fps / self._frame_stride:.0f} fps)")
         print(f"\nControls: Click raindrops | ESC to quit")
         print(f"{'='*70}\n")
         
@@ -195,33 +290,48 @@ class RainstreamSession:
         cv2.namedWindow(window_name, cv2.WINDOW_NORMAL)
         cv2.setMouseCallback(window_name, self.mouse_callback)
         
-        while True:
-            ret, frame = self.cap.read()
-            if not ret:
-                print("End of video reached.")
-                break
-            
-            if self.frames_processed >= self.target_frames:
-                print(f"Duration limit reached ({self.duration_sec}s).")
-                break
-            
-            self.current_timestamp = self.frames_processed / self.fps
-            display_frame = self.process_frame(frame)
-            cv2.imshow(window_name, display_frame)
-            
-            key = cv2.waitKey(1) & 0xFF
-            if key == 27:
-                print("User quit.")
-                break
-            
-            self.frames_processed += 1
-            self.current_frame_index += 1
-            
-            if self.frames_processed % int(self.fps) == 0:
-                print(f"  {self.current_timestamp:.1f}s - {len(self.current_droplets)} droplets detected")
+        # Decoding runs on a reader thread; detection, display and mouse callbacks stay on
+        # this thread (HighGUI needs it), so current_droplets is never shared across threads
+        frames = queue.Queue(maxsize=4)
+        stop = threading.Event()
+        reader = threading.Thread(target=self._read_loop, args=(frames, stop), daemon=True)
+        reader.start()
+        report_every = max(1, round(self.fps / self._frame_stride))
         
-        self.cap.release()
-        cv2.destroyAllWindows()
+        try:
+            # Opened inside the try so a failure here still stops the reader and releases the capture
+            self._frames_fp = open(self.frames_path, 'wb')
+            while True:
+                item = frames.get()
+                if item is None:
+                    if self.current_frame_index + self._frame_stride >= self.target_frames:
+                        print(f"Duration limit reached ({self.duration_sec}s).")
+                    else:
+                        print("End of video reached.")
+                    break
+                self.current_frame_index, frame = item
+                
+                self.current_timestamp = self.current_frame_index / self.fps
+                display_frame = self.process_frame(frame)
+                cv2.imshow(window_name, display_frame)
+                
+                key = cv2.waitKey(1) & 0xFF
+                if key == 27:
+                    print("User quit.")
+                    break
+                
+                self.frames_processed += 1
+                
+                if self.frames_processed % report_every == 0:
+                    print(f"  {self.current_timestamp:.1f}s - {len(self.current_droplets)} droplets detected")
+        finally:
+            stop.set()
+            reader.join()
+            self.cap.release()
+            cv2.destroyAllWindows()
+            if self._frames_fp is not None:
+                self._frames_fp.close()
+                self._frames_fp = None
         print(f"\n{'='*70}\nSession Complete\n{'='*70}\n")
     
     def to_dict(self):
@@ -233,11 +343,14 @@ class RainstreamSession:
             'duration_sec': self.duration_sec,
             'fps': self.fps,
             'resolution': {'width': self.frame_width, 'height': self.frame_height},
-            'frames': {'processed': self.frames_processed, 'target': self.target_frames},
+            'frames': {'processed': self.frames_processed, 'detected': self.frames_detected,
+                       'target': self.target_frames, 'stride': self._frame_stride},
             'detections': {
                 'total_droplets': self.total_droplets_detected,
-                'avg_droplets_per_frame': round(self.total_droplets_detected / max(1, self.frames_processed), 2),
-                'per_frame': self.detections_per_frame
+                'avg_droplets_per_frame': round(self.total_droplets_detected / max(1, self.frames_detected), 2),
+                'detect_every_n': self.detect_every_n,
+                'detect_scale': self.detector.detect_scale,
+                'per_frame_file': self.frames_path
             },
             'interaction': {
                 'total_clicks': self.total_clicks,
@@ -253,8 +366,8 @@ class RainstreamSession:
         if output_path is None:
             output_path = f"rainstream_session_{self.session_id}.json"
         data = self.to_dict()
-        with open(output_path, 'w') as f:
-            json.dump(data, f, indent=2)
+        with open(output_path, 'wb') as f:
+            f.write(orjson.dumps(data, option=orjson.OPT_INDENT_2 | orjson.OPT_SERIALIZE_NUMPY))
         return output_path
     
     def print_summary(self):
@@ -262,7 +375,7 @@ class RainstreamSession:
         print(f"Duration: {self.current_timestamp:.1f}s")
         print(f"Frames processed: {self.frames_processed}")
         print(f"Total droplets detected: {self.total_droplets_detected}")
-        print(f"Avg droplets per frame: {self.total_droplets_detected / max(1, self.frames_processed):.1f}\n")
+        print(f"Avg droplets per frame: {self.total_droplets_detected / max(1, self.frames_detected):.1f}\n")
         print(f"Total clicks: {self.total_clicks}")
         print(f"Hits: {self.hits}")
         print(f"Misses: {self.misses}")
@@ -275,6 +388,9 @@ def main():
     parser.add_argument('video', help='Path to MP4 video file')
     parser.add_argument('--duration', type=int, default=30, help='Session duration in seconds (default: 30)')
     parser.add_argument('--output', default=None, help='Output JSON path')
+    parser.add_argument('--detect-every', type=int, default=2, help='Run detection every N frames (default: 2)')
+    parser.add_argument('--detect-scale', type=float, default=1.0,
+                        help='Detect on a frame downscaled by this factor; below 1.0 small drops are missed (default: 1.0)')
     
     args = parser.parse_args()
     
@@ -283,7 +399,7 @@ def main():
         print(f"Error: Video file not found: {args.video}")
         sys.exit(1)
     
-    session = RainstreamSession(args.video, args.duration)
+    session = RainstreamSession(args.video, args.duration, args.detect_every, args.detect_scale)
     session.run()
     session.print_summary()
     
@@ -293,14 +409,14 @@ def main():
     data = session.to_dict()
     print("JSON Output Preview:")
     print("-" * 70)
-    print(json.dumps({
+    print(orjson.dumps({
         'session_id': data['session_id'],
         'video_file': data['video_file'],
         'duration_sec': data['duration_sec'],
         'frames_processed': data['frames']['processed'],
         'detections': data['detections'],
         'interaction': data['interaction']
-    }, indent=2))
+    }, option=orjson.OPT_INDENT_2 | orjson.OPT_SERIALIZE_NUMPY).decode())
     print("-" * 70)
 
 
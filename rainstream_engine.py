@@ -6,13 +6,20 @@ Linux + Termux Compatible | Full Encryption | Offline Mode
 """
 
 import json
+import functools
 import hashlib
+import math
 import sqlite3
 import os
+import time
 from datetime import datetime
 from typing import List, Dict, Tuple
 from enum import Enum
 import numpy as np
+from scipy.spatial import cKDTree
+
+# Up to this many drops, stream pairs come from a dense distance matrix; above it, a KD-tree
+DENSE_PAIR_LIMIT = 64
 
 # ============================================================================
 # SECURITY & PRIVACY
@@ -59,8 +66,9 @@ class SecurityProtocol:
         return True
     
     @staticmethod
+    @functools.lru_cache(maxsize=256)
     def hash_username(username: str) -> str:
-        """Hash username - cannot be reversed to PII"""
+        """Hash username - cannot be reversed to PII (memoized per process)"""
         return hashlib.sha256(username.encode()).hexdigest()[:16]
 
 # ============================================================================
@@ -102,7 +110,8 @@ class RaindropAnalysis:
             'streams': streams,
             'pattern_type': pattern_type,
             'complexity': len(streams),
-            'timestamp': datetime.now().isoformat()
+            # Monotonic ns for in-process correlation; wall-clock ISO is only formatted on write-out
+            'timestamp_ns': time.monotonic_ns()
         }
     
     def _identify_streams(self, positions: np.ndarray, detections: List[Dict]) -> List[Dict]:
@@ -114,27 +123,48 @@ class RaindropAnalysis:
         if len(positions) < 2:
             return streams
         
-        # Calculate distances between all pairs
-        distances = np.linalg.norm(positions[:, np.newaxis, :] - positions[np.newaxis, :, :], axis=2)
+        # All (owner, member) pairs with 0 < d < 50 (drops self and coincident drops), sorted
+        # by owner then member. Small frames use a dense distance matrix, larger ones a
+        # single KD-tree query, which avoids the N x N matrix
+        n_pos = len(positions)
+        if n_pos <= DENSE_PAIR_LIMIT:
+            diff = positions[:, np.newaxis, :] - positions[np.newaxis, :, :]
+            d2 = np.einsum('ijk,ijk->ij', diff, diff)
+            owners, members = np.nonzero((d2 > 0) & (d2 < 50 * 50))
+        else:
+            tree = cKDTree(positions)
+            pairs = tree.sparse_distance_matrix(tree, 50, output_type='ndarray')
+            dist = pairs['v']
+            pairs = pairs[(dist > 0) & (dist < 50)]
+            key = pairs['i'].astype(np.int64) * n_pos + pairs['j']
+            key.sort()
+            owners, members = np.divmod(key, n_pos)
+        if len(owners) == 0:
+            return streams
+        
+        # Group pairs by owning drop and keep groups of 2+
+        starts = np.flatnonzero(np.r_[True, owners[1:] != owners[:-1]])
+        counts = np.diff(np.r_[starts, len(owners)])
+        member_xy = positions[members].astype(np.float64)
         
-        # Group nearby raindrops (likely same stream)
-        for i in range(len(positions)):
-            nearby = np.where((distances[i] > 0) & (distances[i] < 50))[0]
-            
-            if len(nearby) > 1:
-                stream_positions = positions[nearby]
-                center_x = np.mean(stream_positions[:, 0])
-                center_y = np.mean(stream_positions[:, 1])
-                
-                streams.append({
-                    'center_x': center_x,
-                    'center_y': center_y,
-                    'member_count': len(nearby),
-                    'confidence': min(1.0, len(nearby) / 10),
-                    'radius': np.std(stream_positions),
-                    'color': 'YELLOW',  # AI detected
-                    'members': [int(j) for j in nearby]
-                })
+        centers = np.add.reduceat(member_xy, starts, axis=0) / counts[:, np.newaxis]
+        # Std over both coordinates of the members, as np.std(stream_positions)
+        overall = centers.mean(axis=1)
+        sq_dev = np.add.reduceat(((member_xy - np.repeat(overall, counts)[:, np.newaxis])**2).sum(axis=1), starts)
+        radii = np.sqrt(sq_dev / (2 * counts))
+        
+        # Each group of nearby raindrops is a likely stream
+        for g in np.flatnonzero(counts > 1).tolist():
+            n = int(counts[g])
+            streams.append({
+                'center_x': centers[g, 0],
+                'center_y': centers[g, 1],
+                'member_count': n,
+                'confidence': min(1.0, n / 10),
+                'radius': radii[g],
+                'color': 'YELLOW',  # AI detected
+                'members': members[starts[g]:starts[g] + n].tolist()
+            })
         
         # Remove duplicate streams
         return self._deduplicate_streams(streams)
@@ -144,19 +174,25 @@ class RaindropAnalysis:
         if not streams:
             return []
         
-        unique_streams = [streams[0]]
-        for stream in streams[1:]:
-            is_duplicate = False
-            for existing in unique_streams:
-                dist = np.sqrt((stream['center_x'] - existing['center_x'])**2 + 
-                             (stream['center_y'] - existing['center_y'])**2)
-                if dist < 30:
-                    is_duplicate = True
-                    break
-            if not is_duplicate:
-                unique_streams.append(stream)
+        centers = np.array([[s['center_x'], s['center_y']] for s in streams])
+        
+        # All candidate duplicate pairs (i < j) in one KD-tree query; the query is
+        # inclusive, so re-apply the strict d < 30 test
+        threshold2 = 30 * 30
+        pairs = cKDTree(centers).query_pairs(r=30, output_type='ndarray')
+        d2 = np.sum((centers[pairs[:, 0]] - centers[pairs[:, 1]])**2, axis=1)
+        pairs = pairs[d2 < threshold2]
+        
+        earlier = [[] for _ in streams]
+        for i, j in pairs.tolist():
+            earlier[j].append(i)
         
-        return unique_streams
+        # Keep a stream unless it is close to an earlier stream that was kept
+        kept = [False] * len(streams)
+        for j in range(len(streams)):
+            kept[j] = not any(kept[i] for i in earlier[j])
+        
+        return [stream for stream, keep in zip(streams, kept) if keep]
     
     def _classify_pattern(self, positions: np.ndarray) -> str:
         """Classify raindrop pattern type"""
@@ -203,11 +239,12 @@ class HumanDetectionTracker:
         Check if human click matches AI detection
         Returns True if human found what AI predicted
         """
-        click_dist = np.sqrt((human_click['x'] - ai_detection['x'])**2 + 
-                            (human_click['y'] - ai_detection['y'])**2)
+        dx = human_click['x'] - ai_detection['x']
+        dy = human_click['y'] - ai_detection['y']
         
-        # Within detection radius = correlation
-        return click_dist < ai_detection['radius'] + 10
+        # Within detection radius = correlation (compared squared, no sqrt)
+        reach = ai_detection['radius'] + 10
+        return dx * dx + dy * dy < reach * reach
     
     def get_collaboration_color(self, ai_detected: bool, human_detected: bool) -> str:
         """
@@ -233,14 +270,26 @@ class SecureLeaderboard:
     Data: Username Hash, Points, AI Score, Human Score
     """
     
-    def __init__(self, db_path: str = '/tmp/rainstream_leaderboard.db'):
+    PATTERN_INSERT = '''
+        INSERT INTO pattern_history
+        (username_hash, frame_number, ai_detections, human_detections, 
+         correlations, pattern_type, timestamp)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    '''
+    
+    def __init__(self, db_path: str = '/tmp/rainstream_leaderboard.db', flush_every: int = 100):
         self.db_path = db_path
+        self.flush_every = flush_every
+        self._pending_patterns: List[Tuple] = []
         self._init_db()
     
     def _init_db(self):
-        """Initialize encrypted database"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        """Initialize encrypted database (one connection kept open for the session)"""
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        # WAL + NORMAL: commits no longer fsync the main database file each time
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        cursor = self._conn.cursor()
         
         cursor.execute('''
             CREATE TABLE IF NOT EXISTS leaderboard (
@@ -269,8 +318,7 @@ class SecureLeaderboard:
             )
         ''')
         
-        conn.commit()
-        conn.close()
+        self._conn.commit()
     
     def add_score(self, username: str, points: int, ai_score: float, 
                  human_score: float, device_type: str):
@@ -280,8 +328,7 @@ class SecureLeaderboard:
         """
         username_hash = SecurityProtocol.hash_username(username)
         
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        cursor = self._conn.cursor()
         
         cursor.execute('''
             INSERT OR REPLACE INTO leaderboard 
@@ -290,13 +337,11 @@ class SecureLeaderboard:
         ''', (username_hash, points, ai_score, human_score, 
               datetime.now().isoformat(), device_type))
         
-        conn.commit()
-        conn.close()
+        self._conn.commit()
     
     def get_top_scores(self, limit: int = 10) -> List[Dict]:
         """Get top leaderboard scores (no PII)"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        cursor = self._conn.cursor()
         
         cursor.execute('''
             SELECT username_hash, points, ai_score, human_score 
@@ -314,30 +359,38 @@ class SecureLeaderboard:
                 'human_score': row[3]
             })
         
-        conn.close()
         return scores
     
     def record_pattern_analysis(self, username: str, frame_data: Dict):
-        """Record pattern analysis for research (anonymized)"""
+        """Record pattern analysis for research (anonymized, buffered until flush)"""
         username_hash = SecurityProtocol.hash_username(username)
         
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        self._pending_patterns.append((
+            username_hash, frame_data.get('frame', 0),
+            len(frame_data.get('ai_detected', [])),
+            len(frame_data.get('human_detected', [])),
+            len(frame_data.get('correlations', [])),
+            frame_data.get('pattern_type', 'UNKNOWN'),
+            datetime.now().isoformat()))
         
-        cursor.execute('''
-            INSERT INTO pattern_history
-            (username_hash, frame_number, ai_detections, human_detections, 
-             correlations, pattern_type, timestamp)
-            VALUES (?, ?, ?, ?, ?, ?, ?)
-        ''', (username_hash, frame_data.get('frame', 0),
-              len(frame_data.get('ai_detected', [])),
-              len(frame_data.get('human_detected', [])),
-              len(frame_data.get('correlations', [])),
-              frame_data.get('pattern_type', 'UNKNOWN'),
-              datetime.now().isoformat()))
-        
-        conn.commit()
-        conn.close()
+        if len(self._pending_patterns) >= self.flush_every:
+            self.flush()
+    
+    def flush(self):
+        """Write buffered pattern history rows in a single transaction"""
+        if not self._pending_patterns:
+            return
+        self._conn.executemany(self.PATTERN_INSERT, self._pending_patterns)
+        self._conn.commit()
+        self._pending_patterns = []
+    
+    def close(self):
+        """Flush pending rows and close the database connection"""
+        if self._conn is None:
+            return
+        self.flush()
+        self._conn.close()
+        self._conn = None
 
 # ============================================================================
 # STREAM ANALYSIS (Raindrop → Stream Correlation)
@@ -363,43 +416,43 @@ class StreamCorrelationAnalyzer:
             'transitions': []          # Drop → Stream transitions
         }
         
-        if not frame_previous:
+        if not frame_previous or not frame_current:
             return analysis
         
-        # Match raindrops between frames
-        for current_drop in frame_current:
-            closest_previous = self._find_closest_match(current_drop, frame_previous)
+        # Match raindrops between frames: all current x previous distances in one pass
+        current_xy = np.array([[d['x'], d['y']] for d in frame_current], dtype=np.float64)
+        previous_xy = np.array([[d['x'], d['y']] for d in frame_previous], dtype=np.float64)
+        matches, match_d2 = self._closest_matches(current_xy, previous_xy, 100 * 100)  # Max movement = 100px
+        
+        for current_drop, j, d2 in zip(frame_current, matches.tolist(), match_d2.tolist()):
+            if j < 0:
+                continue
+            closest_previous = frame_previous[j]
+            movement = math.sqrt(d2)
             
-            if closest_previous:
-                movement = np.sqrt((current_drop['x'] - closest_previous['x'])**2 +
-                                 (current_drop['y'] - closest_previous['y'])**2)
-                
-                analysis['transitions'].append({
-                    'raindrop_id': id(current_drop),
-                    'previous_position': (closest_previous['x'], closest_previous['y']),
-                    'current_position': (current_drop['x'], current_drop['y']),
-                    'movement_pixels': movement,
-                    'velocity': movement / 33  # ~30 FPS
-                })
+            analysis['transitions'].append({
+                'raindrop_id': id(current_drop),
+                'previous_position': (closest_previous['x'], closest_previous['y']),
+                'current_position': (current_drop['x'], current_drop['y']),
+                'movement_pixels': movement,
+                'velocity': movement / 33  # ~30 FPS
+            })
         
         return analysis
     
-    def _find_closest_match(self, target: Dict, candidates: List[Dict]) -> Dict:
-        """Find closest raindrop in previous frame"""
-        if not candidates:
-            return None
-        
-        min_dist = float('inf')
-        closest = None
-        
-        for candidate in candidates:
-            dist = np.sqrt((target['x'] - candidate['x'])**2 + 
-                         (target['y'] - candidate['y'])**2)
-            if dist < min_dist and dist < 100:  # Max movement = 100px
-                min_dist = dist
-                closest = candidate
-        
-        return closest
+    @staticmethod
+    def _closest_matches(targets: np.ndarray, candidates: np.ndarray,
+                         max_d2: float) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Nearest candidate for each target (rows are x, y)
+        Returns: candidate index per target (-1 if none closer than sqrt(max_d2)) and its squared distance
+        """
+        diff = targets[:, np.newaxis, :] - candidates[np.newaxis, :, :]
+        d2 = np.einsum('ijk,ijk->ij', diff, diff)
+        best = np.argmin(d2, axis=1)
+        best_d2 = d2[np.arange(len(targets)), best]
+        best[best_d2 >= max_d2] = -1
+        return best, best_d2
 
 # ============================================================================
 # EXPORT FUNCTIONS
@@ -507,3 +560,4 @@ if __name__ == '__main__':
     stream_analyzer = StreamCorrelationAnalyzer()
     
     print("\n✅ All systems initialized and secure\n")
+    leaderboard.close()
@@ -33,7 +33,7 @@ echo "✅ Python3 found: $(python3 --version)"
 
 # Install dependencies
 echo "Installing dependencies..."
-pip3 install numpy cryptography -q
+pip3 install numpy scipy cryptography -q
 echo "✅ Dependencies installed"
 
 # Create config file